@@ -1,15 +1,15 @@
 # glassy_calculator_dandan.py
 from __future__ import annotations
-import sys, ast, random, math
+import sys, os, ast, random, math, functools, decimal
 from PySide6 import QtCore, QtGui, QtWidgets
 
 # ---------------- Safe evaluator ----------------
 class SafeEval:
-    ALLOWED = (
+    ALLOWED = frozenset({
         ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant,
         ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.Pow,
         ast.USub, ast.UAdd, ast.FloorDiv
-    )
+    })
     OPS = {
         ast.Add: lambda a, b: a + b,
         ast.Sub: lambda a, b: a - b,
@@ -20,31 +20,55 @@ class SafeEval:
         ast.Pow: lambda a, b: a ** b,
     }
     def eval(self, text: str) -> float:
+        return self._evaluate(text)
+    @classmethod
+    @functools.lru_cache(maxsize=256)
+    def _evaluate(cls, text: str) -> float:
+        # results are a pure function of the text; failures raise and aren't cached.
+        # Cached per class, not per instance, so the cache keeps no SafeEval alive.
         try:
             node = ast.parse(text, mode="eval")
         except SyntaxError as e:
             raise ValueError("Invalid expression") from e
-        if not self._ok(node):
+        # reject the whole tree before any arithmetic runs (ast.walk is iterative)
+        if any(type(n) not in cls.ALLOWED for n in ast.walk(node)):
             raise ValueError("Disallowed expression")
-        return self._eval(node.body)
-    def _ok(self, n: ast.AST) -> bool:
-        if not isinstance(n, self.ALLOWED): return False
-        return all(self._ok(c) for c in ast.iter_child_nodes(n))
-    def _eval(self, n: ast.AST) -> float:
-        if isinstance(n, ast.Constant):
-            if isinstance(n.value, (int, float)): return float(n.value)
-            raise ValueError("Invalid constant")
-        if isinstance(n, ast.UnaryOp):
-            v = self._eval(n.operand)
-            if isinstance(n.op, ast.USub): return -v
-            if isinstance(n.op, ast.UAdd): return +v
-            raise ValueError("Bad unary")
-        if isinstance(n, ast.BinOp):
-            a, b = self._eval(n.left), self._eval(n.right)
-            op = type(n.op)
-            if op is ast.Div and b == 0: raise ZeroDivisionError("Division by zero")
-            if op in self.OPS: return float(self.OPS[op](a, b))
-        raise ValueError("Bad expression")
+        return cls._eval(node)
+    @classmethod
+    def _eval(cls, root: ast.AST) -> float:
+        # post-order evaluation with explicit stacks (no recursion); root is already validated
+        todo = [(root, False)]; vals = []
+        while todo:
+            n, ready = todo.pop()
+            t = type(n)
+            if t is ast.Constant:
+                if not isinstance(n.value, (int, float)): raise ValueError("Invalid constant")
+                vals.append(float(n.value))
+            elif t is ast.Expression:
+                todo.append((n.body, False))
+            elif not ready:
+                todo.append((n, True))
+                if t is ast.BinOp: todo.append((n.right, False)); todo.append((n.left, False))
+                else: todo.append((n.operand, False))
+            elif t is ast.UnaryOp:
+                op = type(n.op)
+                if op is ast.USub: vals[-1] = -vals[-1]
+                elif op is not ast.UAdd: raise ValueError("Bad unary")
+            else:
+                b = vals.pop(); a = vals.pop()
+                op = type(n.op)
+                if op is ast.Div and b == 0: raise ZeroDivisionError("Division by zero")
+                if op not in cls.OPS: raise ValueError("Bad expression")
+                vals.append(float(cls.OPS[op](a, b)))
+        return vals[0]
+
+def format_result(v: float) -> str:
+    """Display text for a result: at most 12 decimals, no exponent (the keypad has no 'e')."""
+    if not math.isfinite(v): raise ValueError("Non-finite result")
+    v = round(v, 12)
+    if v.is_integer(): return str(int(v))
+    # repr gives the shortest round-tripping digits; Decimal expands any exponent
+    return format(decimal.Decimal(repr(v)), "f")
 
 # ---------------- Theming ----------------
 class Theme:
@@ -52,6 +76,7 @@ class Theme:
         self.name=name; self.bg_top=bg_top; self.bg_bottom=bg_bottom
         self.text=text; self.panel=panel; self.accent=accent
         self.btn_bg=btn_bg; self.btn_bg_hover=btn_bg_hover; self.btn_text=btn_text
+        self._ripple_css = None  # RippleButton stylesheet, built on first use
 
 def theme_light():
     return Theme(
@@ -97,38 +122,83 @@ class AnimeDandanBackground(QtWidgets.QWidget):
         self._beat_period = 0.45  # seconds per "dan"
         self._make_speedlines()
         self._make_stars()
+        self._update_frame()
+        self._build_theme_cache()
         self.timer = QtCore.QTimer(self, timeout=self._tick)
-        self.timer.start(int(self.dt*1000))
+        self.timer.setInterval(int(self.dt*1000))  # started/stopped by show/hide events
 
     def setTheme(self, theme: Theme):
         self.theme = theme
+        self._build_theme_cache()
         self.update()
 
+    def _build_theme_cache(self):
+        # colors only change with the theme: one QColor per alpha value, looked up while painting
+        self._accent_lut = []; self._text_lut = []
+        for a in range(256):
+            c = QtGui.QColor(self.theme.accent); c.setAlpha(a); self._accent_lut.append(c)
+            c = QtGui.QColor(self.theme.text); c.setAlpha(a); self._text_lut.append(c)
+        self._build_gradients()
+
+    def _build_gradients(self):
+        # gradients depend on the theme and the widget size only
+        w, h = self.width(), self.height()
+        self._bg_gradient = QtGui.QLinearGradient(0, 0, 0, h)
+        self._bg_gradient.setColorAt(0.0, self.theme.bg_top)
+        self._bg_gradient.setColorAt(1.0, self.theme.bg_bottom)
+        self._glow_gradient = QtGui.QRadialGradient(QtCore.QPointF(w/2.0, h/2.0), math.hypot(w, h) * 0.75)
+        self._glow_gradient.setColorAt(0.0, self._accent_lut[30])
+        self._glow_gradient.setColorAt(1.0, self._accent_lut[0])
+
     def _make_speedlines(self):
+        # struct-of-arrays: one list per attribute, indexed by line
         random.seed(5)
-        self.lines = []
         n = 72
+        self._line_angle = [(i / n) * 360.0 for i in range(n)]
+        self._line_phase = [i * 0.5 for i in range(n)]
+        self._line_width, self._line_len_k, self._line_omega = [], [], []
         for i in range(n):
-            self.lines.append({
-                "angle": (i / n) * 360.0,
-                "width": random.uniform(2.0, 5.0),
-                "len_k": random.uniform(0.75, 1.15),
-                "omega": random.choice([25.0, 35.0, 45.0]) * (1 if i % 2 else -1)  # deg/sec
-            })
+            self._line_width.append(float(round(random.uniform(2.0, 5.0))))  # 4 widths -> few pens
+            self._line_len_k.append(random.uniform(0.75, 1.15))
+            self._line_omega.append(random.choice([25.0, 35.0, 45.0]) * (1 if i % 2 else -1))  # deg/sec
 
     def _make_stars(self):
         random.seed(9)
-        self.stars = []
+        self._star_x, self._star_y, self._star_phase, self._star_freq, self._star_size = [], [], [], [], []
         for _ in range(120):
-            self.stars.append({
-                "x": random.random(),
-                "y": random.random(),
-                "phase": random.uniform(0, math.tau),
-                "freq": random.uniform(0.8, 2.2),
-                "size": random.uniform(0.8, 1.6),
-            })
+            self._star_x.append(random.random())
+            self._star_y.append(random.random())
+            self._star_phase.append(random.uniform(0, math.tau))
+            self._star_freq.append(random.uniform(0.8, 2.2))
+            self._star_size.append(random.uniform(0.8, 1.6))
+        self._star_px = []
+
+    def _update_frame(self):
+        # per-frame state, independent of widget size; paintEvent only scales it
+        t = self.t; sin, cos, radians = math.sin, math.cos, math.radians
+        rads = [radians(a + t*om) for a, om in zip(self._line_angle, self._line_omega)]
+        self._line_dir = [(cos(r) * k, sin(r) * k) for r, k in zip(rads, self._line_len_k)]
+        # alphas are snapped to 8 levels so paintEvent can batch draws per level
+        self._line_alpha = [70 + int(50 * (0.5 + 0.5*sin(t*2.0 + ph))) // 7 * 7 for ph in self._line_phase]
+        self._star_alpha = [64 + int(96 * (0.5 + 0.5*sin(t*f + ph))) // 13 * 13
+                            for f, ph in zip(self._star_freq, self._star_phase)]
+
+    def resizeEvent(self, e):
+        w, h = self.width(), self.height()
+        self._star_px = [QtCore.QPointF(x*w, y*h) for x, y in zip(self._star_x, self._star_y)]
+        self._build_gradients()
+        super().resizeEvent(e)
+
+    def showEvent(self, e):
+        self.timer.start(); super().showEvent(e)
+
+    def hideEvent(self, e):
+        self.timer.stop(); super().hideEvent(e)
 
     def _tick(self):
+        # nothing on screen to animate: minimized, hidden or fully covered
+        if not self.isVisible() or self.window().isMinimized() or self.visibleRegion().isEmpty():
+            return
         self.t += self.dt
         self._beat_accum += self.dt
         if self._beat_accum >= self._beat_period:
@@ -141,6 +211,7 @@ class AnimeDandanBackground(QtWidgets.QWidget):
             r[2] *= 0.985
         # drop faded rings
         self.rings = [r for r in self.rings if r[2] > 0.02]
+        self._update_frame()
         self.update()
 
     def paintEvent(self, _):
@@ -152,58 +223,44 @@ class AnimeDandanBackground(QtWidgets.QWidget):
         p.setRenderHint(QtGui.QPainter.Antialiasing)
 
         # gradient sky
-        g = QtGui.QLinearGradient(0, 0, 0, h)
-        g.setColorAt(0.0, self.theme.bg_top)
-        g.setColorAt(1.0, self.theme.bg_bottom)
-        p.fillRect(self.rect(), g)
+        p.fillRect(self.rect(), self._bg_gradient)
 
         # subtle rotating accent glow
-        glow = QtGui.QRadialGradient(QtCore.QPointF(cx, cy), R)
-        accent = QtGui.QColor(self.theme.accent)
-        accent.setAlpha(30)
-        transparent = QtGui.QColor(self.theme.accent); transparent.setAlpha(0)
-        glow.setColorAt(0.0, accent)
-        glow.setColorAt(1.0, transparent)
-        p.fillRect(self.rect(), glow)
+        p.fillRect(self.rect(), self._glow_gradient)
 
         # speed lines (anime opener vibes)
         p.save()
         pen = QtGui.QPen(self.theme.accent)
-        for i, ln in enumerate(self.lines):
-            ang = ln["angle"] + self.t * ln["omega"]
-            rad = math.radians(ang)
-            length = R * ln["len_k"]
-            x2 = cx + math.cos(rad) * length
-            y2 = cy + math.sin(rad) * length
-            alpha = 70 + int(50 * (0.5 + 0.5*math.sin(self.t*2.0 + i*0.5)))
-            c = QtGui.QColor(self.theme.accent); c.setAlpha(alpha)
-            pen.setColor(c); pen.setWidthF(ln["width"])
+        center = QtCore.QPointF(cx, cy)
+        batches = {}  # (width, alpha) -> point pairs
+        for (ux, uy), alpha, width in zip(self._line_dir, self._line_alpha, self._line_width):
+            batches.setdefault((width, alpha), []).extend((center, QtCore.QPointF(cx + ux*R, cy + uy*R)))
+        for (width, alpha), pts in batches.items():
+            pen.setColor(self._accent_lut[alpha]); pen.setWidthF(width)
             p.setPen(pen)
-            p.drawLine(QtCore.QPointF(cx, cy), QtCore.QPointF(x2, y2))
+            p.drawLines(pts)
         p.restore()
 
         # twinkling stars
         p.save()
         p.setPen(QtCore.Qt.NoPen)
-        for s in self.stars:
-            b = 0.4 + 0.6 * (0.5 + 0.5*math.sin(self.t*s["freq"] + s["phase"]))
-            c = QtGui.QColor(self.theme.text)
-            c.setAlpha(int(160*b))
-            p.setBrush(c)
-            sx, sy = s["x"]*w, s["y"]*h
-            r = s["size"]
-            p.drawEllipse(QtCore.QRectF(sx-r, sy-r, r*2, r*2))
+        batches = {}  # alpha -> [(center, r), ...]
+        for pt, alpha, r in zip(self._star_px, self._star_alpha, self._star_size):
+            batches.setdefault(alpha, []).append((pt, r))
+        for alpha, stars in batches.items():
+            p.setBrush(self._text_lut[alpha])
+            for pt, r in stars:
+                p.drawEllipse(pt, r, r)
         p.restore()
 
         # pulsing rings (the "dan-dan" beat)
         p.save()
-        ring_color = QtGui.QColor(self.theme.accent)
-        for r in self.rings:
-            ring_color.setAlpha(int(255 * r[2]))
-            pen = QtGui.QPen(ring_color)
-            pen.setWidth(2)
-            p.setPen(pen); p.setBrush(QtCore.Qt.NoBrush)
-            p.drawEllipse(QtCore.QRectF(cx-r[0], cy-r[0], r[0]*2, r[0]*2))
+        pen = QtGui.QPen(self.theme.accent); pen.setWidth(2)
+        p.setBrush(QtCore.Qt.NoBrush)
+        for rad, _, alpha in self.rings:
+            pen.setColor(self._accent_lut[int(255 * alpha)])
+            p.setPen(pen)
+            p.drawEllipse(center, rad, rad)
         p.restore()
 
 # ---------------- Frosted panel with clipping ----------------
@@ -212,29 +269,37 @@ class FrostedPanel(QtWidgets.QFrame):
         super().__init__(parent)
         self.theme = theme
         self.setAttribute(QtCore.Qt.WA_TranslucentBackground, True)
-        self._shadow = QtWidgets.QGraphicsDropShadowEffect(
-            blurRadius=40, offset=QtCore.QPointF(0,10),
-            color=QtGui.QColor(0,0,0,120))
-        self.setGraphicsEffect(self._shadow)
+        # The shadow renders the panel offscreen and re-blurs it on every background frame;
+        # blur cost grows with radius^2, so keep it small. DANDAN_LOW_FX=1 (or true/yes) turns it off.
+        self._shadow = None
+        if os.environ.get("DANDAN_LOW_FX", "").strip().lower() not in ("1", "true", "yes"):
+            self._shadow = QtWidgets.QGraphicsDropShadowEffect(
+                blurRadius=16, offset=QtCore.QPointF(0,10),
+                color=QtGui.QColor(0,0,0,120))
+            self.setGraphicsEffect(self._shadow)
         self._radius = 24
+        self._mask_key = None  # (rect, radius) the cached path/mask were built for
         self._update_mask()
     def setTheme(self, theme: Theme):
         self.theme = theme; self.update()
     def _update_mask(self):
         r = self.rect().adjusted(1,1,-1,-1)
-        path = QtGui.QPainterPath(); path.addRoundedRect(r, self._radius, self._radius)
-        self.setMask(QtGui.QRegion(path.toFillPolygon().toPolygon()))
+        if self._mask_key == (r, self._radius): return
+        self._mask_key = (r, self._radius)
+        self._path = QtGui.QPainterPath(); self._path.addRoundedRect(r, self._radius, self._radius)
+        self._mask_region = QtGui.QRegion(self._path.toFillPolygon().toPolygon())
+        self.setMask(self._mask_region)
     def resizeEvent(self, e):
         self._update_mask(); super().resizeEvent(e)
     def paintEvent(self, _):
+        self._update_mask()  # no-op unless the rect or radius changed
         p = QtGui.QPainter(self); p.setRenderHint(QtGui.QPainter.Antialiasing)
-        rect = self.rect().adjusted(1,1,-1,-1)
-        path = QtGui.QPainterPath(); path.addRoundedRect(rect, self._radius, self._radius)
         p.setPen(QtGui.QPen(QtGui.QColor(255,255,255,70), 1))
-        p.fillPath(path, self.theme.panel); p.drawPath(path)
+        p.fillPath(self._path, self.theme.panel); p.drawPath(self._path)
 
 # ---------------- Ripple button ----------------
 class RippleButton(QtWidgets.QPushButton):
+    RIPPLE_STEPS = 8  # over 220 ms: indistinguishable from a repaint per animation tick
     def __init__(self, text: str, theme: Theme, parent=None):
         super().__init__(text, parent)
         self.theme = theme
@@ -242,13 +307,22 @@ class RippleButton(QtWidgets.QPushButton):
         self.setMinimumHeight(56)
         self.setFlat(True)
         self._center = QtCore.QPoint(0,0); self._radius = 0; self._opacity = 0.0; self._max = 40
+        self._last_step = -1  # ripple is repainted in RIPPLE_STEPS discrete steps
+        self._ripple_gradient = QtGui.QRadialGradient()
         self._anim = QtCore.QVariantAnimation(self, duration=220,
                                               valueChanged=self._step, finished=self._end)
         self.updateTheme(theme)
     def updateTheme(self, theme: Theme):
         self.theme = theme
-        t = self.theme.btn_text; b = self.theme.btn_bg; h = self.theme.btn_bg_hover
-        self.setStyleSheet(f"""
+        # every button shares one sheet string per theme
+        if theme._ripple_css is None: theme._ripple_css = self._css(theme)
+        self.setStyleSheet(theme._ripple_css)
+        self._ripple_c1 = QtGui.QColor(theme.accent)
+        self._ripple_c2 = QtGui.QColor(theme.accent); self._ripple_c2.setAlpha(0)
+    @staticmethod
+    def _css(theme: Theme) -> str:
+        t = theme.btn_text; b = theme.btn_bg; h = theme.btn_bg_hover
+        return f"""
             QPushButton {{
                 border: none; border-radius: 14px;
                 font-size: 20px; padding: 10px 14px;
@@ -258,16 +332,19 @@ class RippleButton(QtWidgets.QPushButton):
             QPushButton:hover {{
                 background-color: rgba({h.red()},{h.green()},{h.blue()},{h.alpha()});
             }}
-        """)
+        """
     def mousePressEvent(self, e: QtGui.QMouseEvent):
         self._center = e.position().toPoint()
         self._max = max(self.width(), self.height()) * 0.9
-        self._radius = 0; self._opacity = 0.35
+        self._radius = 0; self._opacity = 0.35; self._last_step = -1
         self._anim.stop(); self._anim.setStartValue(0.0); self._anim.setEndValue(1.0); self._anim.start()
         super().mousePressEvent(e)
     def _step(self, v):
-        self._radius = int(self._max * float(v))
-        self._opacity = max(0.0, 0.35 * (1.0 - float(v)))
+        step = int(float(v) * self.RIPPLE_STEPS)
+        if step == self._last_step: return
+        self._last_step = step; v = step / self.RIPPLE_STEPS
+        self._radius = int(self._max * v)
+        self._opacity = max(0.0, 0.35 * (1.0 - v))
         self.update()
     def _end(self):
         self._opacity = 0.0; self.update()
@@ -275,13 +352,12 @@ class RippleButton(QtWidgets.QPushButton):
         super().paintEvent(e)
         if self._opacity <= 0: return
         p = QtGui.QPainter(self); p.setRenderHint(QtGui.QPainter.Antialiasing)
-        grad = QtGui.QRadialGradient(self._center, max(1, self._radius))
-        c1 = QtGui.QColor(self.theme.accent); c1.setAlphaF(min(1.0, self._opacity))
-        c2 = QtGui.QColor(self.theme.accent); c2.setAlpha(0)
-        grad.setColorAt(0.0, c1); grad.setColorAt(1.0, c2)
+        grad = self._ripple_gradient
+        grad.setCenter(self._center); grad.setFocalPoint(self._center); grad.setRadius(max(1, self._radius))
+        self._ripple_c1.setAlphaF(min(1.0, self._opacity))
+        grad.setStops([(0.0, self._ripple_c1), (1.0, self._ripple_c2)])
         p.setPen(QtCore.Qt.NoPen); p.setBrush(grad)
-        r = self._radius
-        p.drawEllipse(QtCore.QRectF(self._center.x()-r, self._center.y()-r, r*2, r*2))
+        p.drawEllipse(self._center, self._radius, self._radius)
 
 # ---------------- Calculator ----------------
 class Calculator(QtWidgets.QMainWindow):
@@ -295,6 +371,7 @@ class Calculator(QtWidgets.QMainWindow):
         self.theme = theme_dark()
         self.eval = SafeEval()
         self.expr = ""
+        self._buttons: list[RippleButton] = []  # re-themed on toggle, avoids findChildren()
 
         # Layers (use the new anime background)
         self.bg = AnimeDandanBackground(self.theme); self.setCentralWidget(self.bg)
@@ -310,6 +387,7 @@ class Calculator(QtWidgets.QMainWindow):
         title.setStyleSheet(self._label_css())
         self.theme_btn = RippleButton("Toggle theme", self.theme)
         self.theme_btn.setFixedHeight(50); self.theme_btn.clicked.connect(self.toggle_theme)
+        self._buttons.append(self.theme_btn)
         hdr.addWidget(title); hdr.addStretch(1); hdr.addWidget(self.theme_btn)
         lay.addLayout(hdr)
 
@@ -328,6 +406,7 @@ class Calculator(QtWidgets.QMainWindow):
             btn = RippleButton(text, self.theme)
             btn.clicked.connect(lambda _=False, t=text: self.on_button(t))
             grid.addWidget(btn, r, c, rs, cs)
+            self._buttons.append(btn)
             return btn
 
         add("AC", 0, 0); add("Back", 0, 1); add("(", 0, 2); add(")", 0, 3)
@@ -349,6 +428,11 @@ class Calculator(QtWidgets.QMainWindow):
             QtCore.Qt.Key.Key_Backspace: "Back", QtCore.Qt.Key.Key_Delete: "AC", QtCore.Qt.Key.Key_Percent: "%",
         }
 
+        # re-elide the display once a resize drag settles, not on every resize event
+        self._resize_timer = QtCore.QTimer(self, singleShot=True, interval=30,
+                                           timeout=lambda: self._set_display(self.expr or "0"))
+        self._metrics_font = None; self._metrics = None
+
         self._apply_theme()
         self._set_display("0")
 
@@ -362,9 +446,11 @@ class Calculator(QtWidgets.QMainWindow):
     def _apply_theme(self):
         self.bg.setTheme(self.theme); self.panel.setTheme(self.theme)
         self.display.setStyleSheet(self._display_css())
-        for b in self.findChildren(RippleButton): b.updateTheme(self.theme)
-        pal = self.palette(); pal.setColor(QtGui.QPalette.WindowText, self.theme.text)
-        self.setPalette(pal); self.update()
+        for b in self._buttons: b.updateTheme(self.theme)
+        pal = self.palette()
+        if pal.color(QtGui.QPalette.WindowText) != self.theme.text:
+            pal.setColor(QtGui.QPalette.WindowText, self.theme.text); self.setPalette(pal)
+        self.update()
     def toggle_theme(self):
         self.theme = theme_light() if self.theme.name == "dark" else theme_dark()
         self._apply_theme()
@@ -380,18 +466,20 @@ class Calculator(QtWidgets.QMainWindow):
         if not self.expr: return
         try:
             v = self.eval.eval(self.expr)
-            text = str(int(v)) if abs(v - int(v)) < 1e-12 else (f"{v:.12f}".rstrip("0").rstrip("."))
+            text = format_result(v)
             self.expr = text; self._set_display(text)
         except ZeroDivisionError:
             self._set_display("Division by zero"); self.expr = ""
         except Exception:
             self._set_display("Error"); self.expr = ""
     def _set_display(self, text: str):
-        metrics = QtGui.QFontMetrics(self.display.font())
-        elided = metrics.elidedText(text, QtCore.Qt.ElideLeft, self.display.width() - 16)
+        font = self.display.font()
+        if font != self._metrics_font:
+            self._metrics_font = font; self._metrics = QtGui.QFontMetrics(font)
+        elided = self._metrics.elidedText(text, QtCore.Qt.ElideLeft, self.display.width() - 16)
         self.display.setText(elided)
     def resizeEvent(self, e):
-        self._set_display(self.expr or "0")
+        self._resize_timer.start()
         super().resizeEvent(e)
 
 # ---------------- main ----------------
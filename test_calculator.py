@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("PySide6")
+from calculator import SafeEval, format_result
+
+
+@pytest.mark.parametrize("value, text", [
+    # integers and short fractions
+    (3.0, "3"),
+    (-0.5, "-0.5"),
+    (2.5, "2.5"),
+    (1 / 3, "0.333333333333"),
+    # float noise is rounded away
+    (0.1 + 0.2, "0.3"),
+    (3 * 0.1 * 10, "3"),
+    (123456.789, "123456.789"),
+    (1e-13, "0"),
+    # large values keep their fractional digits, no exponent
+    (123456789012.5, "123456789012.5"),
+    (12345678901234.56, "12345678901234.56"),
+    (2.0 ** 70, "1180591620717411303424"),
+    # small values stay in fixed point so more digits can be typed after them
+    (1e-05, "0.00001"),
+    (-1e-05, "-0.00001"),
+])
+def test_format_result(value, text):
+    assert format_result(value) == text
+
+
+@pytest.mark.parametrize("value", [float("inf"), float("-inf"), float("nan")])
+def test_format_result_rejects_non_finite(value):
+    with pytest.raises(ValueError):
+        format_result(value)
+
+
+def test_formatted_result_evaluates_back():
+    # the display text becomes the next expression, so chaining must not lose digits
+    for expr in ("123456789012 + 0.5", "1 / 100000", "12345678901234.56 * 1"):
+        v = SafeEval().eval(expr)
+        assert SafeEval().eval(format_result(v)) == v